@@ -1,14 +1,11 @@
 import re
 import random
+from functools import lru_cache
 
 
-def roll_formula(formula: str, **vars) -> int:
-    # все переменные, которых нет — 0
-    for var in re.findall(r"\{(\w+)}", formula):
-        if var not in vars:
-            vars[var] = 0
-    formula = formula.format(**vars)
-
+@lru_cache(maxsize=256)
+def parse_formula(formula: str) -> tuple[int, int, int]:
+    """Разбирает подставленную формулу в (кол-во кубов, граней, модификатор)."""
     formula = formula.lower().replace("д", "d").replace("к", "d").replace(" ", "")
 
     match = re.search(r"\(([^)]+)\)", formula)
@@ -18,12 +15,20 @@ def roll_formula(formula: str, **vars) -> int:
     dice_pattern = re.fullmatch(r'(\d+)[d](\d+)([+-]\d+)?', formula)
     if dice_pattern:
         n, sides, modifier = dice_pattern.groups()
-        total = sum(random.randint(1, int(sides)) for _ in range(int(n)))
-        if modifier:
-            total += int(modifier)
-        return total
+        return int(n), int(sides), int(modifier) if modifier else 0
 
     try:
-        return int(formula)
+        return 0, 0, int(formula)
     except ValueError:
-        raise ValueError(f"Неверный формат броска: {formula}")
\ No newline at end of file
+        raise ValueError(f"Неверный формат броска: {formula}")
+
+
+def roll_formula(formula: str, **vars) -> int:
+    # все переменные, которых нет — 0
+    for var in re.findall(r"\{(\w+)}", formula):
+        if var not in vars:
+            vars[var] = 0
+    formula = formula.format(**vars)
+
+    n, sides, modifier = parse_formula(formula)
+    return sum(random.randint(1, sides) for _ in range(n)) + modifier
@@ -5,22 +5,31 @@ Features:
 - /roll Divination -> d20 prophecy mode
 - Persistent HP system for chat participants
 - /dmg <target>, /heal <target>, /resurrection <target>, /hp
+- Webhook mode (PUBLIC_URL, PORT); set USE_POLLING=1 to poll instead
 """
 
 from __future__ import annotations
 
-import json
 import logging
 import os
 import random
 import asyncio
+import contextlib
+import secrets
+import time
 from dataclasses import dataclass
-from datetime import date, datetime
 from pathlib import Path
 from typing import Any
 
+import orjson
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 from telegram import Update, User
 from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.request import HTTPXRequest
 
 from dice_roll import roll_formula
 
@@ -30,34 +39,71 @@ logging.basicConfig(
 )
 LOGGER = logging.getLogger(__name__)
 
-STATE_PATH = Path("telegram_dnd_bot_state.json")
+STATE_PATH = Path("players.json")
+# Single-file state written by older versions; read once if STATE_PATH is missing.
+LEGACY_STATE_PATH = Path("telegram_dnd_bot_state.json")
+USAGE_LOG_PATH = Path("usage.jsonl")
+AUTO_SAVE_INTERVAL = 5.0
 MAX_HP = 100
 DAILY_LIMIT = 10
 WEEKLY_RESURRECTION_LIMIT = 1
-
-
-DIVINATION_LINES: dict[int, str] = {
-    1: "не делай этого — ты буквально умрёшь.",
-    2: "ох-ох, кажется, сегодня не твой день :)",
-    3: "лучше отложи. правда, лучше отложи",
-    4: "идея смелая… и опасная. подготовь резервные планы от b до x",
-    5: "может сработать, если сначала помолиться всем кубическим богам.",
-    6: "шансы скромные, но упрямство иногда творит чудеса.",
-    7: "ну в целом, почти. будет близко, но скорее всего не выйдет",
-    8: "получится, но с тобой произойдет неприятный казус",
-    9: "выпало девять. как думаешь что это значит?",
-    10: "в целом получится, но осторожно: лишний шаг — и будет драма.",
-    11: "средне-хорошо. не легендарно, но достойно.",
-    12: "да, если делать уверенно и без паники.",
-    13: "кубы кивают. пахнет успехом. и шампунем",
-    14: "очень неплохо: фортуна уже поправляет тебе корону, принцесса",
-    15: "да! и красиво. плюс вайб и аура фарминг",
-    16: "отличный знак. я смотрю ты неплоха",
-    17: "почти триумф. главное — не сглазь.",
-    18: "твой момент. делай и сияй. (empty e-hu, e-hu)",
-    19: "великолепно. сегодня ты главный герой этого дерьма.",
-    20: "БОГИ ВСТАЮТ ПЕРЕД ТОБОЙ НА КОЛЕНИ",
+DAILY_REFILL_PER_SEC = DAILY_LIMIT / 86400
+WEEKLY_RESURRECTION_REFILL_PER_SEC = WEEKLY_RESURRECTION_LIMIT / (7 * 86400)
+PLAYER_TTL = 30 * 86400
+
+_RNG = random.Random()
+
+# Loaded once in main() and mutated in place by the handlers.
+STATE: dict[str, Any] = {}
+# Set by handlers after a mutation; the persistence loop flushes STATE to disk.
+_dirty = asyncio.Event()
+# Lowercased player name -> user_id, kept in sync by ensure_player. Shared names
+# resolve to the first registered player, as the old linear scan did.
+_name_index: dict[str, str] = {}
+# user_id -> (first_name, last_name, username, display name); pruned with players.
+_display_names: dict[str, tuple[str, str | None, str | None, str]] = {}
+# In-memory token buckets: actor_id -> (tokens, last refill timestamp).
+# Rebuilt at startup by replaying USAGE_LOG_PATH.
+_dmg_buckets: dict[str, tuple[float, float]] = {}
+_heal_buckets: dict[str, tuple[float, float]] = {}
+_resurrection_buckets: dict[str, tuple[float, float]] = {}
+# mode -> (buckets, capacity, refill per second)
+_BUCKETS: dict[str, tuple[dict[str, tuple[float, float]], float, float]] = {
+    "dmg": (_dmg_buckets, DAILY_LIMIT, DAILY_REFILL_PER_SEC),
+    "heal": (_heal_buckets, DAILY_LIMIT, DAILY_REFILL_PER_SEC),
+    "resurrection": (
+        _resurrection_buckets,
+        WEEKLY_RESURRECTION_LIMIT,
+        WEEKLY_RESURRECTION_REFILL_PER_SEC,
+    ),
 }
+# Append-only descriptor for USAGE_LOG_PATH, opened in on_startup.
+_usage_log_fd: int | None = None
+
+
+# Indexed by d20 result - 1.
+DIVINATION_LINES: tuple[str, ...] = (
+    "не делай этого — ты буквально умрёшь.",
+    "ох-ох, кажется, сегодня не твой день :)",
+    "лучше отложи. правда, лучше отложи",
+    "идея смелая… и опасная. подготовь резервные планы от b до x",
+    "может сработать, если сначала помолиться всем кубическим богам.",
+    "шансы скромные, но упрямство иногда творит чудеса.",
+    "ну в целом, почти. будет близко, но скорее всего не выйдет",
+    "получится, но с тобой произойдет неприятный казус",
+    "выпало девять. как думаешь что это значит?",
+    "в целом получится, но осторожно: лишний шаг — и будет драма.",
+    "средне-хорошо. не легендарно, но достойно.",
+    "да, если делать уверенно и без паники.",
+    "кубы кивают. пахнет успехом. и шампунем",
+    "очень неплохо: фортуна уже поправляет тебе корону, принцесса",
+    "да! и красиво. плюс вайб и аура фарминг",
+    "отличный знак. я смотрю ты неплоха",
+    "почти триумф. главное — не сглазь.",
+    "твой момент. делай и сияй. (empty e-hu, e-hu)",
+    "великолепно. сегодня ты главный герой этого дерьма.",
+    "БОГИ ВСТАЮТ ПЕРЕД ТОБОЙ НА КОЛЕНИ",
+)
 
 
 HELP_TEXT = (
@@ -73,6 +119,26 @@ HELP_TEXT = (
     "• `/hp` — твои текущие HP"
 )
 
+FORMULA_ERROR_TEXT = (
+    "🌫️ Туман скрывает формулу. Попробуй так:\n"
+    "/roll, /roll 1d20+5, /roll 2д6+3, /roll ({str}+1)d20 str=3\n"
+    "Ошибка: "
+)
+DELTA_NO_TARGET_TEXT = (
+    "✨ Укажи цель: `/dmg <ник>` или `/heal <ник>`, "
+    "либо ответь командой на сообщение нужного игрока."
+)
+RESURRECTION_NO_TARGET_TEXT = (
+    "🌙 Укажи, кого воскрешать: `/resurrection <ник>` "
+    "или ответь командой на сообщение игрока."
+)
+DMG_EXHAUSTED_TEXT = f"🕯️ На сегодня твои заряды урона исчерпаны ({DAILY_LIMIT}/{DAILY_LIMIT})."
+HEAL_EXHAUSTED_TEXT = f"🕯️ На сегодня твои заряды лечения исчерпаны ({DAILY_LIMIT}/{DAILY_LIMIT})."
+RESURRECTION_EXHAUSTED_TEXT = (
+    "⛔ На этой неделе у тебя уже был ритуал воскрешения "
+    f"({WEEKLY_RESURRECTION_LIMIT}/{WEEKLY_RESURRECTION_LIMIT})."
+)
+
 
 @dataclass
 class Target:
@@ -80,23 +146,180 @@ class Target:
     name: str
 
 
+@dataclass(slots=True)
+class Player:
+    name: str
+    hp: int = MAX_HP
+    last_seen: int = 0
+
+
 def load_state() -> dict[str, Any]:
-    if not STATE_PATH.exists():
-        return {"players": {}, "usage": {}}
+    path = STATE_PATH if STATE_PATH.exists() else LEGACY_STATE_PATH
+    if not path.exists():
+        return {"players": {}}
 
     try:
-        payload = json.loads(STATE_PATH.read_text(encoding="utf-8"))
-    except (OSError, json.JSONDecodeError):
+        payload = orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
         LOGGER.warning("Failed to load state, creating new state file")
-        return {"players": {}, "usage": {}}
-
-    payload.setdefault("players", {})
-    payload.setdefault("usage", {})
+        return {"players": {}}
+
+    now = int(time.time())
+    payload["players"] = {
+        user_id: Player(
+            name=str(raw.get("name", "")),
+            hp=int(raw.get("hp", MAX_HP)),
+            last_seen=int(raw.get("last_seen", now)),
+        )
+        for user_id, raw in payload.get("players", {}).items()
+    }
+    # Legacy usage counters are superseded by USAGE_LOG_PATH.
+    payload.pop("usage", None)
     return payload
 
 
-def save_state(state: dict[str, Any]) -> None:
-    STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+def load_usage() -> None:
+    # Replays the usage log into the token buckets and compacts away entries that
+    # no longer affect them.
+    if not USAGE_LOG_PATH.exists():
+        return
+
+    # (mode, actor) -> [(line number, line)] since that bucket was last full.
+    live: dict[tuple[str, str], list[tuple[int, bytes]]] = {}
+    for lineno, line in enumerate(USAGE_LOG_PATH.read_bytes().splitlines()):
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # A torn last line from a crash mid-append.
+            continue
+        if not isinstance(record, dict):
+            continue
+        t, actor, mode = record.get("t"), record.get("actor"), record.get("mode")
+        if (
+            not isinstance(t, (int, float))
+            or isinstance(t, bool)
+            or not isinstance(actor, str)
+            or mode not in _BUCKETS
+        ):
+            continue
+
+        buckets, capacity, refill_per_sec = _BUCKETS[mode]
+        key = (mode, actor)
+        bucket = buckets.get(actor)
+        # Everything before a moment the bucket was full can't affect it any more.
+        if bucket is None or _bucket_tokens(bucket, refill_per_sec, t) >= capacity:
+            live[key] = []
+        try_consume(buckets, actor, capacity, refill_per_sec, now=t)
+        live[key].append((lineno, line))
+
+    now = time.time()
+    kept: list[tuple[int, bytes]] = []
+    for (mode, actor), lines in live.items():
+        buckets, capacity, refill_per_sec = _BUCKETS[mode]
+        if _bucket_tokens(buckets[actor], refill_per_sec, now) >= capacity:
+            del buckets[actor]
+        else:
+            kept.extend(lines)
+    kept.sort()
+
+    tmp_path = USAGE_LOG_PATH.with_name(USAGE_LOG_PATH.name + ".tmp")
+    tmp_path.write_bytes(b"".join(line + b"\n" for _, line in kept))
+    os.replace(tmp_path, USAGE_LOG_PATH)
+
+
+def open_usage_log() -> None:
+    global _usage_log_fd
+    _usage_log_fd = os.open(USAGE_LOG_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+
+def close_usage_log() -> None:
+    global _usage_log_fd
+    if _usage_log_fd is not None:
+        os.close(_usage_log_fd)
+        _usage_log_fd = None
+
+
+def log_usage(actor_id: str, mode: str, amount: int) -> None:
+    if _usage_log_fd is None:
+        return
+    record = {"t": time.time(), "actor": actor_id, "mode": mode, "amt": amount}
+    try:
+        os.write(_usage_log_fd, orjson.dumps(record) + b"\n")
+    except OSError:
+        LOGGER.exception("Failed to append usage log")
+
+
+def dump_state() -> bytes:
+    # orjson serializes the Player dataclasses natively.
+    return orjson.dumps(STATE, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+
+def write_state(payload: bytes) -> None:
+    tmp_path = STATE_PATH.with_name(STATE_PATH.name + ".tmp")
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def save_state() -> None:
+    write_state(dump_state())
+
+
+def _bucket_tokens(bucket: tuple[float, float], refill_per_sec: float, now: float) -> float:
+    tokens, last_refill = bucket
+    return tokens + (now - last_refill) * refill_per_sec
+
+
+def _prune_buckets(
+    buckets: dict[str, tuple[float, float]],
+    capacity: float,
+    refill_per_sec: float,
+    now: float,
+) -> None:
+    # A bucket that has refilled to capacity is indistinguishable from a missing one.
+    for actor_id, bucket in list(buckets.items()):
+        if _bucket_tokens(bucket, refill_per_sec, now) >= capacity:
+            del buckets[actor_id]
+
+
+def prune_state() -> None:
+    cutoff = int(time.time()) - PLAYER_TTL
+    players = STATE["players"]
+    for user_id, player in list(players.items()):
+        if player.last_seen < cutoff:
+            del players[user_id]
+            unindex_name(user_id, player.name)
+            _display_names.pop(user_id, None)
+
+    now = time.time()
+    for buckets, capacity, refill_per_sec in _BUCKETS.values():
+        _prune_buckets(buckets, capacity, refill_per_sec, now)
+
+
+async def _persistence_loop() -> None:
+    while True:
+        await _dirty.wait()
+        # Coalesce every mutation made during the interval into one write.
+        await asyncio.sleep(AUTO_SAVE_INTERVAL)
+        _dirty.clear()
+        write: asyncio.Future[None] | None = None
+        try:
+            prune_state()
+            # Serialize on the loop thread so handlers can't mutate STATE mid-dump;
+            # only the blocking file I/O is moved off the loop.
+            payload = dump_state()
+            write = asyncio.ensure_future(asyncio.to_thread(write_state, payload))
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Cancelling doesn't stop the worker thread; let the write finish
+            # so it can't race the final save_state() on the same temp file.
+            if write is not None:
+                with contextlib.suppress(Exception):
+                    await write
+            raise
+        except Exception:
+            # Keep the loop alive; the next mutation (or shutdown) retries.
+            LOGGER.exception("Failed to save state")
+            _dirty.set()
 
 
 def user_display_name(user: User | None) -> str:
@@ -109,68 +332,113 @@ def user_display_name(user: User | None) -> str:
     return str(user.id)
 
 
-def ensure_player(state: dict[str, Any], user_id: str, name: str) -> dict[str, Any]:
-    players = state["players"]
-    player = players.get(user_id)
-    if not player:
-        player = {"name": name, "hp": MAX_HP}
-        players[user_id] = player
-    else:
-        player["name"] = name
-        player.setdefault("hp", MAX_HP)
-    return player
+def cached_display_name(user: User | None) -> str:
+    if not user:
+        return user_display_name(user)
 
+    # The raw fields are compared so a renamed user still gets a fresh display name.
+    user_id = str(user.id)
+    cached = _display_names.get(user_id)
+    if (
+        cached is not None
+        and cached[0] == user.first_name
+        and cached[1] == user.last_name
+        and cached[2] == user.username
+    ):
+        return cached[3]
 
-def current_day_key() -> str:
-    return date.today().isoformat()
+    name = user_display_name(user)
+    _display_names[user_id] = (user.first_name, user.last_name, user.username, name)
+    return name
 
 
-def current_week_key() -> str:
-    today = datetime.now().isocalendar()
-    return f"{today.year}-W{today.week:02d}"
+def name_key(name: str) -> str:
+    return name.strip().lower().lstrip("@")
 
 
-def actor_usage(state: dict[str, Any], actor_id: str) -> dict[str, Any]:
-    usage = state["usage"].setdefault(actor_id, {})
+def rebuild_name_index() -> None:
+    _name_index.clear()
+    for user_id, player in STATE["players"].items():
+        _name_index.setdefault(name_key(player.name), user_id)
 
-    day_key = current_day_key()
-    if usage.get("day") != day_key:
-        usage["day"] = day_key
-        usage["dmg"] = 0
-        usage["heal"] = 0
 
-    week_key = current_week_key()
-    if usage.get("week") != week_key:
-        usage["week"] = week_key
-        usage["resurrection"] = 0
+def unindex_name(user_id: str, name: str) -> None:
+    key = name_key(name)
+    if _name_index.get(key) != user_id:
+        return
+    del _name_index[key]
+    # Names aren't unique; hand the key to another player who shares it.
+    for other_id, other in STATE["players"].items():
+        if other_id != user_id and name_key(other.name) == key:
+            _name_index[key] = other_id
+            return
 
-    usage.setdefault("dmg", 0)
-    usage.setdefault("heal", 0)
-    usage.setdefault("resurrection", 0)
-    return usage
+
+def ensure_player(user_id: str, name: str) -> Player:
+    players = STATE["players"]
+    player = players.get(user_id)
+    if player is None:
+        player = Player(name=name, last_seen=int(time.time()))
+        players[user_id] = player
+        _name_index.setdefault(name_key(name), user_id)
+        _dirty.set()
+        return player
+
+    # Not worth a write on its own; flushed together with the next real change.
+    player.last_seen = int(time.time())
+    if player.name != name:
+        unindex_name(user_id, player.name)
+        _name_index[name_key(name)] = user_id
+        player.name = name
+        _dirty.set()
+    return player
 
 
-def find_target_from_arg(state: dict[str, Any], raw_target: str) -> Target | None:
-    needle = raw_target.strip().lower().lstrip("@")
+def try_consume(
+    buckets: dict[str, tuple[float, float]],
+    actor_id: str,
+    capacity: float,
+    refill_per_sec: float,
+    cost: float = 1.0,
+    now: float | None = None,
+) -> bool:
+    if now is None:
+        now = time.time()
+    tokens, last_refill = buckets.get(actor_id, (capacity, now))
+    tokens = min(capacity, tokens + (now - last_refill) * refill_per_sec)
+    if tokens < cost:
+        buckets[actor_id] = (tokens, now)
+        return False
+    buckets[actor_id] = (tokens - cost, now)
+    return True
+
+
+def consume_charge(mode: str, actor_id: str) -> bool:
+    buckets, capacity, refill_per_sec = _BUCKETS[mode]
+    return try_consume(buckets, actor_id, capacity, refill_per_sec)
+
+
+def find_target_from_arg(raw_target: str) -> Target | None:
+    needle = name_key(raw_target)
     if not needle:
         return None
 
-    for user_id, player in state["players"].items():
-        name = str(player.get("name", ""))
-        if name.lower().lstrip("@") == needle:
-            return Target(user_id=user_id, name=name)
-    return None
+    user_id = _name_index.get(needle)
+    if user_id is None:
+        return None
+    return Target(user_id=user_id, name=STATE["players"][user_id].name)
 
 
-def resolve_target(update: Update, context: ContextTypes.DEFAULT_TYPE, state: dict[str, Any]) -> Target | None:
+def resolve_target(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Target | None:
     if update.message and update.message.reply_to_message and update.message.reply_to_message.from_user:
         target_user = update.message.reply_to_message.from_user
-        target_name = user_display_name(target_user)
-        ensure_player(state, str(target_user.id), target_name)
-        return Target(user_id=str(target_user.id), name=target_name)
+        target_id = str(target_user.id)
+        target_name = cached_display_name(target_user)
+        ensure_player(target_id, target_name)
+        return Target(user_id=target_id, name=target_name)
 
     if context.args:
-        matched = find_target_from_arg(state, context.args[0])
+        matched = find_target_from_arg(context.args[0])
         if matched:
             return matched
 
@@ -182,47 +450,42 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.message:
         return
 
-    state = load_state()
-    current_name = user_display_name(update.effective_user)
-    ensure_player(state, str(update.effective_user.id), current_name)
-    save_state(state)
+    current_name = cached_display_name(update.effective_user)
+    ensure_player(str(update.effective_user.id), current_name)
 
     await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
 
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await start(update, context)
-
-
 async def roll(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.message:
         return
 
-    state = load_state()
-    author_name = user_display_name(update.effective_user)
-    ensure_player(state, str(update.effective_user.id), author_name)
-    save_state(state)
+    author_name = cached_display_name(update.effective_user)
+    ensure_player(str(update.effective_user.id), author_name)
 
     if context.args and context.args[0].lower() == "divination":
-        value = random.randint(1, 20)
-        prophecy = DIVINATION_LINES[value]
+        value = _RNG.randrange(20) + 1
+        prophecy = DIVINATION_LINES[value - 1]
         await update.message.reply_text(
             f"🔮 Фэйт Ардент раскручивает нить судьбы... d20 = {value}\n"
             f"{prophecy}"
         )
         return
 
-    formula = context.args[0] if context.args else "1d20"
-    vars_payload = parse_vars(context.args[1:]) if context.args else {}
+    if not context.args or context.args[0] == "1d20":
+        # Plain d20 is by far the most common roll; skip the formula parser.
+        await update.message.reply_text(
+            f"🎲 Фэйт Ардент шепчет: {author_name}, твой бросок 1d20 = {_RNG.randrange(20) + 1}"
+        )
+        return
+
+    formula = context.args[0]
+    vars_payload = parse_vars(context.args[1:])
 
     try:
         result = roll_formula(formula, **vars_payload)
     except ValueError as exc:
-        await update.message.reply_text(
-            "🌫️ Туман скрывает формулу. Попробуй так:\n"
-            "/roll, /roll 1d20+5, /roll 2д6+3, /roll ({str}+1)d20 str=3\n"
-            f"Ошибка: {exc}"
-        )
+        await update.message.reply_text(f"{FORMULA_ERROR_TEXT}{exc}")
         return
 
     await update.message.reply_text(
@@ -253,13 +516,11 @@ async def hp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.message:
         return
 
-    state = load_state()
-    actor_name = user_display_name(update.effective_user)
-    player = ensure_player(state, str(update.effective_user.id), actor_name)
-    save_state(state)
+    actor_name = cached_display_name(update.effective_user)
+    player = ensure_player(str(update.effective_user.id), actor_name)
 
     await update.message.reply_text(
-        f"💗 {actor_name}, я вижу твою жизненную нить: {player['hp']} HP."
+        f"💗 {actor_name}, я вижу твою жизненную нить: {player.hp} HP."
     )
 
 
@@ -275,57 +536,43 @@ async def apply_delta(update: Update, context: ContextTypes.DEFAULT_TYPE, mode:
     if not update.message or not update.effective_user:
         return
 
-    state = load_state()
-    actor_name = user_display_name(update.effective_user)
+    actor_name = cached_display_name(update.effective_user)
     actor_id = str(update.effective_user.id)
-    ensure_player(state, actor_id, actor_name)
+    ensure_player(actor_id, actor_name)
 
-    target = resolve_target(update, context, state)
+    target = resolve_target(update, context)
     if not target:
-        await update.message.reply_text(
-            "✨ Укажи цель: `/dmg <ник>` или `/heal <ник>`, "
-            "либо ответь командой на сообщение нужного игрока.",
-            parse_mode="Markdown",
-        )
-        save_state(state)
+        await update.message.reply_text(DELTA_NO_TARGET_TEXT, parse_mode="Markdown")
         return
 
-    usage = actor_usage(state, actor_id)
-    if mode == "dmg" and usage["dmg"] >= DAILY_LIMIT:
-        await update.message.reply_text("🕯️ На сегодня твои заряды урона исчерпаны (10/10).")
-        save_state(state)
+    if not consume_charge(mode, actor_id):
+        await update.message.reply_text(DMG_EXHAUSTED_TEXT if mode == "dmg" else HEAL_EXHAUSTED_TEXT)
         return
 
-    if mode == "heal" and usage["heal"] >= DAILY_LIMIT:
-        await update.message.reply_text("🕯️ На сегодня твои заряды лечения исчерпаны (10/10).")
-        save_state(state)
-        return
-
-    amount = random.randint(1, 8)
-    player = ensure_player(state, target.user_id, target.name)
+    amount = _RNG.randrange(8) + 1
+    player = ensure_player(target.user_id, target.name)
 
     if mode == "dmg":
-        usage["dmg"] += 1
-        player["hp"] = max(0, int(player["hp"]) - amount)
-        if player["hp"] == 0:
+        player.hp = max(0, player.hp - amount)
+        if player.hp == 0:
             line = (
-                f"💥 Фэйт Ардент наносит {amount} урона {player['name']}.\n"
+                f"💥 Фэйт Ардент наносит {amount} урона {player.name}.\n"
                 "прости ты умерла"
             )
         else:
             line = (
-                f"💥 Фэйт Ардент наносит {amount} урона {player['name']}.\n"
-                f"Осталось: {player['hp']} HP"
+                f"💥 Фэйт Ардент наносит {amount} урона {player.name}.\n"
+                f"Осталось: {player.hp} HP"
             )
     else:
-        usage["heal"] += 1
-        player["hp"] = min(MAX_HP, int(player["hp"]) + amount)
+        player.hp = min(MAX_HP, player.hp + amount)
         line = (
-            f"✨ Фэйт Ардент исцеляет {player['name']} на {amount} HP.\n"
-            f"Теперь: {player['hp']} HP"
+            f"✨ Фэйт Ардент исцеляет {player.name} на {amount} HP.\n"
+            f"Теперь: {player.hp} HP"
         )
 
-    save_state(state)
+    log_usage(actor_id, mode, amount)
+    _dirty.set()
     await update.message.reply_text(line)
 
 
@@ -333,58 +580,115 @@ async def resurrection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if not update.message or not update.effective_user:
         return
 
-    state = load_state()
     actor_id = str(update.effective_user.id)
-    actor_name = user_display_name(update.effective_user)
-    ensure_player(state, actor_id, actor_name)
+    actor_name = cached_display_name(update.effective_user)
+    ensure_player(actor_id, actor_name)
 
-    target = resolve_target(update, context, state)
+    target = resolve_target(update, context)
     if not target:
-        await update.message.reply_text(
-            "🌙 Укажи, кого воскрешать: `/resurrection <ник>` "
-            "или ответь командой на сообщение игрока.",
-            parse_mode="Markdown",
-        )
-        save_state(state)
+        await update.message.reply_text(RESURRECTION_NO_TARGET_TEXT, parse_mode="Markdown")
         return
 
-    usage = actor_usage(state, actor_id)
-    if usage["resurrection"] >= WEEKLY_RESURRECTION_LIMIT:
-        await update.message.reply_text("⛔ На этой неделе у тебя уже был ритуал воскрешения (1/1).")
-        save_state(state)
+    if not consume_charge("resurrection", actor_id):
+        await update.message.reply_text(RESURRECTION_EXHAUSTED_TEXT)
         return
 
-    usage["resurrection"] += 1
-    player = ensure_player(state, target.user_id, target.name)
-    player["hp"] = MAX_HP
-    save_state(state)
+    player = ensure_player(target.user_id, target.name)
+    player.hp = MAX_HP
+    log_usage(actor_id, "resurrection", MAX_HP)
+    _dirty.set()
 
     await update.message.reply_text(
-        f"🕊️ Фэйт Ардент возвращает {player['name']} из-за грани.\n"
+        f"🕊️ Фэйт Ардент возвращает {player.name} из-за грани.\n"
         f"Жизнь восстановлена: {MAX_HP} HP."
     )
 
 
+async def on_startup(application: Application) -> None:
+    open_usage_log()
+    application.bot_data["persistence_task"] = asyncio.create_task(_persistence_loop())
+
+
+async def on_shutdown(application: Application) -> None:
+    task = application.bot_data.pop("persistence_task", None)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            LOGGER.exception("Persistence loop failed")
+    try:
+        save_state()
+    finally:
+        close_usage_log()
+
+
 def main() -> None:
     token = os.getenv("BOT_TOKEN")
     if not token:
         raise RuntimeError("BOT_TOKEN не задан. Пример: export BOT_TOKEN='123:abc'")
 
-    application = Application.builder().token(token).build()
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
+    use_polling = os.getenv("USE_POLLING", "").strip().lower() in {"1", "true", "yes"}
+    public_url = os.getenv("PUBLIC_URL", "").rstrip("/")
+    if not use_polling and not public_url:
+        raise RuntimeError(
+            "PUBLIC_URL не задан. Пример: export PUBLIC_URL='https://bot.example.com' "
+            "(или USE_POLLING=1 для локального запуска)"
+        )
+
+    STATE.update(load_state())
+    rebuild_name_index()
+    load_usage()
+
+    # HTTP/2 multiplexes replies from concurrent handlers over one connection.
+    # getUpdates is a single long poll with nothing to multiplex, so it gets its
+    # own request on the default HTTP/1.1, which is more stable for long timeouts.
+    application = (
+        Application.builder()
+        .token(token)
+        .request(
+            HTTPXRequest(
+                http_version="2",
+                connection_pool_size=64,
+                pool_timeout=5,
+                connect_timeout=5,
+                read_timeout=10,
+            )
+        )
+        .get_updates_request(HTTPXRequest())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    # CommandHandler matches commands case-insensitively, so /Resurrection is covered too.
+    application.add_handler(CommandHandler(["start", "help"], start))
     application.add_handler(CommandHandler("roll", roll))
     application.add_handler(CommandHandler("hp", hp))
     application.add_handler(CommandHandler("dmg", dmg))
     application.add_handler(CommandHandler("heal", heal))
     application.add_handler(CommandHandler("resurrection", resurrection))
-    application.add_handler(CommandHandler("Resurrection", resurrection))
 
-    LOGGER.info("Starting Telegram bot polling")
     # Python 3.14+ no longer creates a default event loop for the main thread.
-    # python-telegram-bot still expects one to exist when run_polling starts.
-    asyncio.set_event_loop(asyncio.new_event_loop())
-    application.run_polling(close_loop=False)
+    # python-telegram-bot still expects one to exist when run_polling/run_webhook starts.
+    asyncio.set_event_loop(uvloop.new_event_loop() if uvloop else asyncio.new_event_loop())
+
+    if use_polling:
+        LOGGER.info("Starting Telegram bot polling")
+        application.run_polling(close_loop=False)
+        return
+
+    secret = secrets.token_urlsafe(24)
+    LOGGER.info("Starting Telegram bot webhook at %s", public_url)
+    application.run_webhook(
+        listen="0.0.0.0",
+        port=int(os.getenv("PORT", "8443")),
+        url_path=secret,
+        secret_token=secret,
+        webhook_url=f"{public_url}/{secret}",
+        close_loop=False,
+    )
 
 
 if __name__ == "__main__":